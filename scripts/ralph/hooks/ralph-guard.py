@@ -17,7 +17,7 @@ Supports both review backends:
 """
 
 # Version for drift detection (bump when making changes)
-RALPH_GUARD_VERSION = "0.13.0"
+RALPH_GUARD_VERSION = "0.14.0"
 
 import json
 import os
@@ -200,12 +200,14 @@ def handle_pre_tool_use(data: dict) -> None:
         if not re.search(r"--repo-root", command):
             output_block(
                 "BLOCKED: setup-review requires --repo-root flag. "
-                'Use: setup-review --repo-root "$REPO_ROOT" --summary "..."'
+                'Use: setup-review --repo-root "$REPO_ROOT" --summary "..." '
+                "--select <paths...> --prompt-file <prompt.md>"
             )
         if not re.search(r"--summary", command):
             output_block(
                 "BLOCKED: setup-review requires --summary flag. "
-                'Use: setup-review --repo-root "$REPO_ROOT" --summary "..."'
+                'Use: setup-review --repo-root "$REPO_ROOT" --summary "..." '
+                "--select <paths...> --prompt-file <prompt.md>"
             )
 
     # Validate select-add has --window and --tab
@@ -69,7 +69,8 @@ set -euo pipefail
 DIR="\$(cd "\$(dirname "\${BASH_SOURCE[0]}")" && pwd)"
 PY="\${PYTHON_BIN:-python3}"
 command -v "\$PY" >/dev/null 2>&1 || PY="python"
-exec "\$PY" "\$DIR/flowctl.py" "\$@"
+# Import (rather than run) flowctl.py so Python reuses cached bytecode
+exec "\$PY" -c 'import os, sys; sys.argv.pop(0); sys.path.insert(0, os.path.dirname(sys.argv[0])); import flowctl; flowctl.main()' "\$DIR/flowctl.py" "\$@"
 SH
     chmod +x "$wrapper" 2>/dev/null || true
     FLOWCTL="$wrapper"
@@ -553,6 +554,19 @@ RUN_ID="$(date -u +%Y%m%d-%H%M%S)-$(rand4)"
 RUN_ID_FULL="$(date -u +%Y%m%dT%H%M%SZ)-$(hostname -s 2>/dev/null || hostname)-$(sanitize_id "$(get_actor)")-$$-$(rand4)"
 RUN_DIR="$SCRIPT_DIR/runs/$RUN_ID"
 mkdir -p "$RUN_DIR"
+# Resolve repo root / state dir / actor once; flowctl (ours and the worker's) reads
+# this instead of spawning git on every call.
+if (cd "$ROOT_DIR" && "$FLOWCTL" context --write "$RUN_DIR/flow-context.json" --json >/dev/null 2>&1); then
+  export FLOW_CONTEXT_FILE="$RUN_DIR/flow-context.json"
+fi
+# Keep one warm flowctl process for the run. flowctl forwards to it through
+# FLOW_DAEMON_SOCKET and runs in-process whenever the daemon is unavailable.
+if [[ "${FLOW_DAEMON:-1}" == "1" ]]; then
+  FLOW_DAEMON_SOCKET="${TMPDIR:-/tmp}/flowctl-$RUN_ID.sock"
+  (cd "$ROOT_DIR" && "$FLOWCTL" serve --socket "$FLOW_DAEMON_SOCKET" >/dev/null 2>&1 &)
+  export FLOW_DAEMON_SOCKET
+  trap '"$FLOWCTL" serve --socket "$FLOW_DAEMON_SOCKET" --stop >/dev/null 2>&1 || true' EXIT
+fi
 ATTEMPTS_FILE="$RUN_DIR/attempts.json"
 ensure_attempts_file "$ATTEMPTS_FILE"
 BRANCHES_FILE="$RUN_DIR/branches.json"
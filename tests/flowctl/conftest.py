@@ -0,0 +1,97 @@
+"""Fixtures for flowctl tests: a scratch git repo and a runner for the CLI."""
+
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+FLOWCTL = Path(__file__).resolve().parents[2] / "scripts" / "ralph" / "flowctl.py"
+
+
+def git(repo: Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=repo, check=True, capture_output=True, text=True
+    ).stdout
+
+
+class Flow:
+    """Runs flowctl inside repo, isolated from the caller's environment."""
+
+    def __init__(self, repo: Path):
+        self.repo = repo
+        self.env = {
+            key: value
+            for key, value in os.environ.items()
+            if not key.startswith("FLOW_")
+        }
+
+    def run(self, *args: str, check: bool = True, stdin: str = None):
+        proc = subprocess.run(
+            [sys.executable, str(FLOWCTL), *args],
+            cwd=self.repo,
+            env=self.env,
+            input=stdin,
+            capture_output=True,
+            text=True,
+        )
+        if check and proc.returncode != 0:
+            raise AssertionError(
+                f"flowctl {' '.join(args)} exited {proc.returncode}:\n"
+                f"{proc.stdout}{proc.stderr}"
+            )
+        return proc
+
+    def json(self, *args: str, check: bool = True) -> dict:
+        return json.loads(self.run(*args, "--json", check=check).stdout)
+
+
+@pytest.fixture
+def repo(tmp_path: Path) -> Path:
+    path = tmp_path / "repo"
+    path.mkdir()
+    git(path, "init", "-q", "-b", "main")
+    git(path, "config", "user.email", "test@example.com")
+    git(path, "config", "user.name", "Test")
+    git(path, "config", "commit.gpgsign", "false")
+    (path / "README.md").write_text("test\n")
+    git(path, "add", "README.md")
+    git(path, "commit", "-q", "-m", "initial")
+    return path
+
+
+@pytest.fixture
+def flow(repo: Path) -> Flow:
+    flow = Flow(repo)
+    flow.run("init")
+    return flow
+
+
+@pytest.fixture
+def memory(flow: Flow) -> Path:
+    flow.run("config", "set", "memory.enabled", "true")
+    flow.run("memory", "init")
+    return flow.repo / ".flow" / "memory"
+
+
+@pytest.fixture(scope="session")
+def flowctl_module():
+    spec = importlib.util.spec_from_file_location("flowctl", FLOWCTL)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def flowctl(flowctl_module, repo: Path, monkeypatch):
+    """The flowctl module, resolving paths against repo."""
+    for key in list(os.environ):
+        if key.startswith("FLOW_"):
+            monkeypatch.delenv(key)
+    monkeypatch.chdir(repo)
+    flowctl_module.reset_context()
+    yield flowctl_module
+    flowctl_module.reset_context()
@@ -0,0 +1,79 @@
+"""FlowCatalog: stamp validation and keyed indexes."""
+
+import json
+import os
+from pathlib import Path
+
+EPIC = "fn-1-add-auth"
+
+
+def make_tasks(flow, count=3):
+    flow.run("epic", "create", "--title", "Add auth")
+    for i in range(1, count + 1):
+        flow.run("task", "create", "--epic", EPIC, "--title", f"Task {i}")
+
+
+def test_same_size_rewrite_in_same_tick_is_seen(flow):
+    make_tasks(flow, count=1)
+    path = flow.repo / ".flow" / "tasks" / f"{EPIC}.1.json"
+    def title():
+        return flow.json("tasks", "--epic", EPIC)["tasks"][0]["title"]
+
+    assert title() == "Task 1"  # Catalog entry built
+
+    st = path.stat()
+    path.write_text(path.read_text().replace("Task 1", "Task 9"))
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))  # Same mtime and size
+    assert path.stat().st_size == st.st_size
+
+    assert title() == "Task 9"
+
+
+def test_status_index_follows_writes_and_edits(flow):
+    make_tasks(flow)
+    flow.run("start", f"{EPIC}.2")
+
+    def ids(status):
+        return [t["id"] for t in flow.json("tasks", "--status", status)["tasks"]]
+
+    assert ids("in_progress") == [f"{EPIC}.2"]
+    assert ids("todo") == [f"{EPIC}.1", f"{EPIC}.3"]
+
+    # Runtime state edited by another tool
+    state_dir = Path(flow.json("state-path")["state_dir"])
+    state_path = state_dir / "tasks" / f"{EPIC}.3.state.json"
+    state_path.write_text(json.dumps({"status": "blocked"}))
+    assert ids("blocked") == [f"{EPIC}.3"]
+    assert ids("todo") == [f"{EPIC}.1"]
+
+
+def test_keyed_indexes(flow, flowctl):
+    make_tasks(flow, count=4)
+    flow.run("task", "set-deps", f"{EPIC}.2", "--deps", f"{EPIC}.1")
+    flow.run("task", "set-deps", f"{EPIC}.3", "--deps", f"{EPIC}.2")
+    flow.run("start", f"{EPIC}.4")
+    actor = flow.json("show", f"{EPIC}.4")["assignee"]
+
+    catalog = flowctl.get_catalog()
+    assert catalog.index("depends_on", EPIC) == {
+        f"{EPIC}.1": [f"{EPIC}.2"], f"{EPIC}.2": [f"{EPIC}.3"],
+    }
+    assert [t["id"] for t in catalog.find("assignee", actor)] == [f"{EPIC}.4"]
+    assert [t["id"] for t in catalog.find("status", "todo", EPIC)] == [
+        f"{EPIC}.1", f"{EPIC}.2", f"{EPIC}.3",
+    ]
+    assert flowctl.find_dependents(f"{EPIC}.1", same_epic=True) == [
+        f"{EPIC}.2", f"{EPIC}.3",
+    ]
+
+    # An in-process write drops the entry from the index until revalidated
+    flowctl.save_task_runtime(f"{EPIC}.1", {"status": "done"})
+    assert [t["id"] for t in catalog.find("status", "done")] == [f"{EPIC}.1"]
+    assert f"{EPIC}.1" not in [t["id"] for t in catalog.find("status", "todo")]
+
+
+def test_unreadable_task_falls_back_to_load_errors(flow):
+    make_tasks(flow, count=2)
+    (flow.repo / ".flow" / "tasks" / f"{EPIC}.2.json").write_text("{not json")
+    proc = flow.run("tasks", "--status", "todo", "--json", check=False)
+    assert proc.returncode != 0
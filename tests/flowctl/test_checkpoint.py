@@ -0,0 +1,117 @@
+"""Checkpoint save/restore."""
+
+import fcntl
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from conftest import FLOWCTL
+
+EPIC = "fn-1-add-auth"
+
+
+def make_epic(flow, tasks=2):
+    flow.run("epic", "create", "--title", "Add auth")
+    for i in range(1, tasks + 1):
+        flow.run("task", "create", "--epic", EPIC, "--title", f"Task {i}")
+
+
+def test_restore_writes_only_what_changed(flow):
+    make_epic(flow)
+    flow.run("checkpoint", "save", "--epic", EPIC)
+    flow.run("start", f"{EPIC}.1")
+    flow.run("task", "set-description", f"{EPIC}.2", "--file", "-",
+             stdin="Changed after the checkpoint\n")
+
+    dry = flow.json("checkpoint", "restore", "--epic", EPIC, "--dry-run")
+    # Task 1 changed only in runtime state, task 2 only in tracked files
+    assert sorted(c["path"] for c in dry["changed_files"]) == [
+        f"tasks/{EPIC}.2.json", f"tasks/{EPIC}.2.md"
+    ]
+    assert dry["changed_runtime"] == [f"{EPIC}.1"]
+    assert flow.json("show", f"{EPIC}.1")["status"] == "in_progress"
+
+    done = flow.json("checkpoint", "restore", "--epic", EPIC)
+    assert done["changed_files"] == dry["changed_files"]
+    assert flow.json("show", f"{EPIC}.1")["status"] == "todo"
+    assert "Changed after" not in flow.run("cat", f"{EPIC}.2").stdout
+    assert not (flow.repo / ".flow" / f".restore-{EPIC}").exists()
+    assert ".restore-*/" in (flow.repo / ".flow" / ".gitignore").read_text()
+
+    again = flow.json("checkpoint", "restore", "--epic", EPIC)
+    assert again["changed_files"] == [] and again["changed_runtime"] == []
+
+
+def test_restore_waits_for_task_writers(flow):
+    make_epic(flow, tasks=1)
+    flow.run("checkpoint", "save", "--epic", EPIC)
+    flow.run("start", f"{EPIC}.1")
+
+    state_dir = flow.json("state-path")["state_dir"]
+    lock_path = f"{state_dir}/locks/{EPIC}.1.lock"
+    with open(lock_path, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # As start/done/block hold it
+        proc = subprocess.Popen(
+            [sys.executable, str(FLOWCTL), "checkpoint", "restore", "--epic", EPIC],
+            cwd=flow.repo, env=flow.env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        time.sleep(1.0)
+        assert proc.poll() is None
+        assert flow.json("show", f"{EPIC}.1")["status"] == "in_progress"
+        fcntl.flock(lock, fcntl.LOCK_UN)
+    assert proc.wait(timeout=30) == 0
+    assert flow.json("show", f"{EPIC}.1")["status"] == "todo"
+
+
+def test_save_list_show_and_restore_at(flow):
+    make_epic(flow, tasks=1)
+    first = flow.json("checkpoint", "save", "--epic", EPIC)
+    flow.run("task", "set-description", f"{EPIC}.1", "--file", "-", stdin="Version two\n")
+    second = flow.json("checkpoint", "save", "--epic", EPIC)
+    assert (first["checkpoint"], second["checkpoint"]) == (1, 2)
+
+    # Kept in the state dir, out of the tracked .flow/ tree
+    state_dir = flow.json("state-path")["state_dir"]
+    assert second["checkpoint_path"].startswith(state_dir)
+    assert not (flow.repo / ".flow" / ".checkpoints").exists()
+
+    listed = flow.json("checkpoint", "list", "--epic", EPIC)
+    assert [c["checkpoint"] for c in listed["checkpoints"]] == [1, 2]
+
+    shown = flow.json("checkpoint", "show", "--epic", EPIC, "--at", "2")
+    assert shown["checkpoint"] == 2
+    [task] = shown["tasks"]
+    assert "Version two" in task["spec"]
+    assert task["data"]["title"] == "Task 1"
+    assert "Task 1" in flow.run("checkpoint", "show", "--epic", EPIC).stdout
+
+    flow.run("checkpoint", "restore", "--epic", EPIC, "--at", "1")
+    assert "Version two" not in flow.run("cat", f"{EPIC}.1").stdout
+    flow.run("checkpoint", "restore", "--epic", EPIC)  # Latest
+    assert "Version two" in flow.run("cat", f"{EPIC}.1").stdout
+
+    missing = flow.run("checkpoint", "restore", "--epic", EPIC, "--at", "7", check=False)
+    assert missing.returncode != 0
+
+
+def test_gc_and_delete_free_blobs_immediately(flow):
+    make_epic(flow, tasks=1)
+    for i in range(3):
+        flow.run("task", "set-description", f"{EPIC}.1", "--file", "-", stdin=f"Rev {i}\n")
+        flow.run("checkpoint", "save", "--epic", EPIC)
+
+    pruned = flow.json("checkpoint", "gc", "--keep", "1")
+    assert pruned["manifests_removed"] == 2
+    assert pruned["blobs_removed"] >= 2  # The two older specs at least
+    [kept] = flow.json("checkpoint", "list", "--epic", EPIC)["checkpoints"]
+    assert kept["checkpoint"] == 3
+    assert "Rev 2" in flow.json("checkpoint", "show", "--epic", EPIC)["tasks"][0]["spec"]
+
+    deleted = flow.json("checkpoint", "delete", "--epic", EPIC)
+    assert deleted["deleted"] and deleted["blobs_removed"] > 0
+    state_dir = flow.json("state-path")["state_dir"]
+    blobs = Path(state_dir) / "checkpoints" / "blobs"
+    assert not any(p.is_file() for p in blobs.rglob("*"))
+    assert flow.json("checkpoint", "list", "--epic", EPIC)["count"] == 0
@@ -0,0 +1,102 @@
+"""codex impl-review --epic: concurrent per-task reviews and their receipts."""
+
+import json
+
+import pytest
+
+from conftest import git
+
+EPIC = "fn-1-add-auth"
+TITLES = {f"{EPIC}.1": "Alpha", f"{EPIC}.2": "Bravo", f"{EPIC}.3": "Charlie"}
+
+
+@pytest.fixture
+def epic(flow, repo):
+    flow.run("epic", "create", "--title", "Add auth")
+    for title in TITLES.values():
+        flow.run("task", "create", "--epic", EPIC, "--title", title)
+    git(repo, "checkout", "-q", "-b", "feature")
+    (repo / "auth.py").write_text("def login():\n    pass\n")
+    git(repo, "add", "auth.py")
+    git(repo, "commit", "-q", "-m", "add auth")
+    return repo / "receipts"
+
+
+@pytest.fixture
+def codex(flowctl, monkeypatch):
+    """Stub codex: verdicts and exit codes by task title; records each call."""
+    outcomes, calls = {}, []
+
+    async def run_codex_exec_async(prompt, session_id=None, sandbox="", on_progress=None):
+        [title] = [t for t in TITLES.values() if t in prompt]
+        calls.append((title, session_id))
+        verdict, exit_code = outcomes[title]
+        run = flowctl.CodexRun(session_id or f"thread-{title}")
+        run.exit_code = exit_code
+        if exit_code:
+            run.stderr = "codex crashed"
+        else:
+            run.feed(f"Review of {title}\n<verdict>{verdict}</verdict>\n")
+        return run
+
+    monkeypatch.setattr(flowctl, "run_codex_exec_async", run_codex_exec_async)
+    return outcomes, calls
+
+
+def review_epic(flowctl, capsys, receipts):
+    argv = [
+        "codex", "impl-review", "--epic", EPIC, "--tasks", ",".join(TITLES),
+        "--base", "main", "--receipt-dir", str(receipts), "--no-cache", "--json",
+    ]
+    args = flowctl.build_parser("codex").parse_args(argv)
+    code = 0
+    try:
+        args.func(args)
+    except SystemExit as e:
+        code = e.code
+    flowctl.reset_context()
+    return code, json.loads(capsys.readouterr().out)
+
+
+def receipt(receipts, task_id):
+    return json.loads((receipts / f"impl-{task_id}.json").read_text())
+
+
+def test_worst_verdict_and_per_task_receipts(flowctl, epic, codex, capsys):
+    outcomes, calls = codex
+    outcomes.update(
+        Alpha=("SHIP", 0), Bravo=("MAJOR_RETHINK", 0), Charlie=("NEEDS_WORK", 0)
+    )
+
+    code, result = review_epic(flowctl, capsys, epic)
+
+    assert code == 0 and result["success"]
+    assert result["verdict"] == "MAJOR_RETHINK"
+    assert [r["id"] for r in result["reviews"]] == list(TITLES)
+    assert sorted(calls) == [("Alpha", None), ("Bravo", None), ("Charlie", None)]
+    for task_id, title in TITLES.items():
+        saved = receipt(epic, task_id)
+        assert saved["id"] == task_id
+        assert saved["verdict"] == outcomes[title][0]
+        assert saved["session_id"] == f"thread-{title}"
+
+
+def test_reruns_resume_sessions_and_any_failure_clears_the_verdict(
+    flowctl, epic, codex, capsys
+):
+    outcomes, calls = codex
+    outcomes.update(Alpha=("SHIP", 0), Bravo=("NEEDS_WORK", 0), Charlie=("SHIP", 0))
+    review_epic(flowctl, capsys, epic)
+    calls.clear()
+
+    outcomes["Bravo"] = ("SHIP", 1)
+    code, result = review_epic(flowctl, capsys, epic)
+
+    # Each task resumes the codex session recorded in its own receipt
+    assert sorted(calls) == [(t, f"thread-{t}") for t in ("Alpha", "Bravo", "Charlie")]
+    assert code == 2 and not result["success"]
+    assert result["verdict"] is None
+    failed = [r for r in result["reviews"] if "error" in r]
+    assert [r["id"] for r in failed] == [f"{EPIC}.2"]
+    assert not (epic / f"impl-{EPIC}.2.json").exists()
+    assert receipt(epic, f"{EPIC}.1")["verdict"] == "SHIP"
@@ -0,0 +1,50 @@
+"""flowctl serve: socket permissions and what gets forwarded."""
+
+import stat
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import FLOWCTL
+
+EPIC = "fn-1-add-auth"
+
+
+@pytest.fixture
+def daemon(flow, tmp_path):
+    sock = tmp_path / "flowctl.sock"
+    proc = subprocess.Popen(
+        [sys.executable, str(FLOWCTL), "serve", "--socket", str(sock)],
+        cwd=flow.repo, env=flow.env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        if sock.exists():
+            break
+        time.sleep(0.05)
+    else:
+        proc.kill()
+        pytest.fail("daemon did not start")
+    flow.env["FLOW_DAEMON_SOCKET"] = str(sock)
+    yield sock
+    flow.run("serve", "--socket", str(sock), "--stop", check=False)
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def test_socket_is_owner_only(daemon):
+    assert stat.S_IMODE(daemon.stat().st_mode) == 0o600
+
+
+@pytest.mark.parametrize("file_arg", [["--file", "-"], ["--file=-"]])
+def test_stdin_commands_run_in_process(flow, daemon, file_arg):
+    flow.run("epic", "create", "--title", "Add auth")
+    flow.run("task", "create", "--epic", EPIC, "--title", "One")
+    flow.run("task", "set-description", f"{EPIC}.1", *file_arg,
+             stdin="Read from the client's stdin\n")
+    assert "Read from the client's stdin" in flow.run("cat", f"{EPIC}.1").stdout
+
@@ -0,0 +1,81 @@
+"""DiffSnapshot.capture: per-file and total caps over the streamed patch."""
+
+import re
+import subprocess
+
+from conftest import git
+
+
+def commit_files(repo, files, message="change"):
+    for name, text in files.items():
+        (repo / name).write_text(text)
+    git(repo, "add", *files)
+    git(repo, "commit", "-q", "-m", message)
+
+
+def full_diff(repo, revision_range):
+    return subprocess.run(
+        ["git", "diff", "--no-color", "--no-ext-diff", revision_range],
+        cwd=repo, check=True, capture_output=True, text=True,
+    ).stdout
+
+
+def split_sections(patch):
+    """{header line: section text including its trailing newline}."""
+    parts = re.split(r"(?m)^(?=diff --git )", patch.rstrip("\n") + "\n")
+    return {part.split("\n", 1)[0]: part for part in parts if part}
+
+
+def test_truncated_file_keeps_a_prefix_of_its_diff(flowctl, repo):
+    base = git(repo, "rev-parse", "HEAD").strip()
+    # Long lines early, short lines later: the short ones must not be kept
+    # once a long one overflowed
+    lines = [f"short {i}" for i in range(200)]
+    lines[20] = "x" * 2000
+    commit_files(repo, {"big.txt": "\n".join(lines) + "\n", "small.txt": "tiny\n"})
+
+    snapshot = flowctl.DiffSnapshot.capture(
+        f"{base}..HEAD", max_bytes=100000, file_max_bytes=1000
+    )
+    full = split_sections(full_diff(repo, f"{base}..HEAD"))
+    kept = split_sections(snapshot.content)
+    big_key = next(key for key in full if "big.txt" in key)
+    small_key = next(key for key in full if "small.txt" in key)
+
+    text, marker = kept[big_key].split("... [diff of big.txt truncated:")
+    assert full[big_key].startswith(text)
+    assert len(text.encode()) <= 1000
+    omitted = len(full[big_key].encode()) - len(text.encode())
+    assert marker == f" {omitted} more bytes]\n"
+    assert kept[small_key].rstrip("\n") == full[small_key].rstrip("\n")
+    assert snapshot.changed_files == ["big.txt", "small.txt"]
+
+
+def test_single_huge_line_is_counted_not_buffered(flowctl, repo):
+    base = git(repo, "rev-parse", "HEAD").strip()
+    commit_files(repo, {"blob.txt": "y" * 300000 + "\nafter\n", "z.txt": "z\n"})
+
+    snapshot = flowctl.DiffSnapshot.capture(
+        f"{base}..HEAD", max_bytes=100000, file_max_bytes=2000
+    )
+    full = split_sections(full_diff(repo, f"{base}..HEAD"))
+    kept = split_sections(snapshot.content)
+    blob_key = next(key for key in full if "blob.txt" in key)
+    text = kept[blob_key].split("... [diff of blob.txt truncated:")[0]
+    assert full[blob_key].startswith(text)
+    assert "after" not in text
+    assert "z.txt" in snapshot.content
+
+
+def test_total_cap_drops_lowest_churn_files(flowctl, repo):
+    base = git(repo, "rev-parse", "HEAD").strip()
+    commit_files(repo, {
+        "a.txt": "".join(f"line {i}\n" for i in range(100)),
+        "b.txt": "one\n",
+    })
+    full = full_diff(repo, f"{base}..HEAD")
+    snapshot = flowctl.DiffSnapshot.capture(
+        f"{base}..HEAD", max_bytes=len(full) - 10, file_max_bytes=100000
+    )
+    assert "lower-churn files omitted: b.txt" in snapshot.content
+    assert full.startswith(snapshot.content.split("\n\n... [diff truncated")[0])
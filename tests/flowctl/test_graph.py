@@ -0,0 +1,103 @@
+"""TaskGraph: traversal, Tarjan SCCs, cycles and whole-graph analysis."""
+
+import random
+
+import pytest
+
+
+@pytest.fixture
+def TaskGraph(flowctl_module):
+    return flowctl_module.TaskGraph
+
+
+def reachable(deps, start):
+    seen, queue = {start}, [start]
+    for node in queue:
+        for dep in deps.get(node, []):
+            if dep not in seen:
+                seen.add(dep)
+                queue.append(dep)
+    return seen
+
+
+def test_closures_and_blocking(TaskGraph):
+    graph = TaskGraph({"a": [], "b": ["a"], "c": ["b", "missing"], "d": ["a"]})
+    assert graph.dependents_of("a") == ["b", "c", "d"]
+    assert graph.prerequisites_of("c") == ["a", "b", "missing"]
+    assert graph.blocking("c", lambda n: n == "b") == ["missing"]
+    assert graph.path("c", "a") == ["c", "b", "a"]
+    assert graph.path("a", "c") is None
+    assert TaskGraph.closure("a", graph.dependents) == ["b", "c", "d"]
+
+
+def test_sccs_come_out_dependencies_first(TaskGraph):
+    graph = TaskGraph({
+        "a": ["b"], "b": ["c"], "c": ["a"],  # cycle
+        "d": ["a"], "e": ["d", "e"],  # self-loop
+        "f": [],
+    })
+    sccs = graph.strongly_connected_components()
+    assert sorted(sccs) == [["a", "b", "c"], ["d"], ["e"], ["f"]]
+    position = {node: i for i, scc in enumerate(sccs) for node in scc}
+    assert position["a"] < position["d"] < position["e"]
+
+    cycles = graph.cycles()
+    assert ["e", "e"] in cycles
+    [loop] = [c for c in cycles if c[0] == "a"]
+    assert loop[0] == loop[-1] == "a" and sorted(loop[:-1]) == ["a", "b", "c"]
+
+
+def test_sccs_match_mutual_reachability(TaskGraph):
+    rng = random.Random(7)
+    for _ in range(50):
+        nodes = [f"n{i}" for i in range(rng.randint(1, 30))]
+        deps = {n: rng.sample(nodes, rng.randint(0, min(3, len(nodes)))) for n in nodes}
+        sccs = TaskGraph(deps).strongly_connected_components()
+        assert sorted(n for scc in sccs for n in scc) == sorted(nodes)
+        reach = {n: reachable(deps, n) for n in nodes}
+        for scc in sccs:
+            expected = sorted(m for m in nodes if m in reach[scc[0]] and scc[0] in reach[m])
+            assert scc == expected
+
+
+def test_long_chain_does_not_recurse(TaskGraph):
+    deps = {f"t{i}": [f"t{i - 1}"] if i else [] for i in range(20000)}
+    graph = TaskGraph(deps)
+    assert len(graph.strongly_connected_components()) == 20000
+    assert graph.topo_order()[0] == "t0"
+    assert graph.analyze()["critical_path"]["length"] == 20000
+
+
+def test_analyze_reports_cycles_missing_and_unreachable(TaskGraph):
+    graph = TaskGraph({
+        "a": [], "b": ["a"], "c": ["b"],
+        "x": ["y"], "y": ["x"], "z": ["x"],
+        "m": ["gone"],
+    })
+    report = graph.analyze()
+    assert report["missing"] == ["gone"]
+    assert report["unreachable"] == ["m", "x", "y", "z"]
+    assert report["critical_path"] == {"length": 3, "path": ["a", "b", "c"]}
+    assert len(report["cycles"]) == 1
+    assert "x" not in graph.topo_order()
+
+
+def test_cascade_reset_skips_a_corrupt_sibling(flow, tmp_path):
+    epic = "fn-1-add-auth"
+    flow.run("epic", "create", "--title", "Add auth")
+    flow.run("task", "create", "--epic", epic, "--title", "One")
+    flow.run("task", "create", "--epic", epic, "--title", "Two", "--deps", f"{epic}.1")
+    flow.run("task", "create", "--epic", epic, "--title", "Three")
+    summary = tmp_path / "summary.md"
+    summary.write_text("Done\n")
+    for task_id in (f"{epic}.1", f"{epic}.2"):
+        flow.run("start", task_id)
+        flow.run("done", task_id, "--summary-file", str(summary),
+                 "--evidence", '{"commits": [], "tests": []}')
+    (flow.repo / ".flow" / "tasks" / f"{epic}.3.json").write_text("{bad")
+
+    result = flow.json("task", "reset", f"{epic}.1", "--cascade")
+
+    assert result["success"]
+    assert result["reset"] == [f"{epic}.1", f"{epic}.2"]
+    assert flow.json("show", f"{epic}.2")["status"] == "todo"
@@ -0,0 +1,215 @@
+"""Memory store: markdown views <-> entries.jsonl, dedup and compaction."""
+
+import json
+
+from conftest import git
+
+MANUAL = "\n## 2026-10-17 manual [pitfall]\nNever vacuum the state database from a hook\n"
+
+
+def store_records(memory):
+    path = memory / "entries.jsonl"
+    return [json.loads(line) for line in path.read_text().splitlines() if line]
+
+
+def test_add_round_trips_through_view_and_store(flow, memory):
+    added = flow.json("memory", "add", "--type", "pitfall", "--tags", "bash",
+                      "Quote globs in bash scripts")
+    assert not added["duplicate"]
+
+    view = (memory / "pitfalls.md").read_text()
+    assert "Quote globs in bash scripts" in view
+    [entry] = [r for r in store_records(memory) if r.get("id") == added["id"]]
+    assert entry["tags"] == ["bash"]
+
+    # Rebuilding the store from the views alone finds the same entry
+    (memory / "entries.jsonl").unlink()
+    listed = flow.json("memory", "list")
+    assert listed["counts"]["pitfalls.md"] == 1
+    assert any(r.get("id") == added["id"] for r in store_records(memory))
+
+
+def test_read_never_writes_views(flow, memory):
+    flow.run("memory", "add", "--type", "pitfall", "Quote globs in bash scripts")
+    with (memory / "pitfalls.md").open("a") as f:
+        f.write(MANUAL)
+    before = {p.name: p.read_bytes() for p in memory.glob("*.md")}
+
+    flow.run("memory", "read")
+    flow.run("memory", "read", "--budget", "1000")
+    flow.run("memory", "list")
+
+    assert {p.name: p.read_bytes() for p in memory.glob("*.md")} == before
+    found = flow.json("memory", "search", "vacuum")
+    assert found["count"] == 1
+    assert "Never vacuum" in found["matches"][0]["entry"]
+
+
+def test_entries_removed_from_view_leave_the_store(flow, memory):
+    with (memory / "pitfalls.md").open("a") as f:
+        f.write(MANUAL)
+    assert flow.json("memory", "search", "vacuum")["count"] == 1
+
+    view = memory / "pitfalls.md"
+    view.write_text(view.read_text().replace(MANUAL, ""))
+    assert flow.json("memory", "search", "vacuum")["count"] == 0
+    assert flow.json("memory", "search", "--ranked", "vacuum")["count"] == 0
+    assert flow.json("memory", "list")["total"] == 0
+
+
+def test_search_defaults_to_case_insensitive_regex(flow, memory):
+    flow.run("memory", "add", "--type", "pitfall", "Quote globs in bash scripts")
+    flow.run("memory", "add", "--type", "convention", "Pin tool versions in CI")
+
+    found = flow.json("memory", "search", "GLOB|ci$")
+    assert found["mode"] == "regex"
+    assert found["count"] == 2
+    assert all("score" not in m for m in found["matches"])
+    assert flow.json("memory", "search", "--top-k", "1", "glob|ci")["count"] == 1
+
+    bad = flow.run("memory", "search", "--json", "(", check=False)
+    assert bad.returncode != 0
+    assert "Invalid regex" in bad.stdout
+
+
+def test_ranked_search_orders_by_relevance(flow, memory):
+    flow.run("memory", "add", "--type", "pitfall", "Quote globs in bash scripts")
+    flow.run("memory", "add", "--type", "pitfall",
+             "Bash globs expand in bash loops; quote bash globs")
+    flow.run("memory", "add", "--type", "convention", "Pin tool versions in CI")
+
+    found = flow.json("memory", "search", "--ranked", "globs bash")
+    assert found["mode"] == "bm25"
+    assert found["count"] == 2
+    assert "bash loops" in found["matches"][0]["entry"]
+    assert found["matches"][0]["score"] > found["matches"][1]["score"]
+    # Words, not a pattern: the regex form would match nothing here
+    assert flow.json("memory", "search", "globs bash")["count"] == 0
+
+
+def test_store_is_gitignored(flow, memory):
+    flow.run("memory", "add", "--type", "decision", "Use SQLite for the state index")
+    status = git(flow.repo, "status", "--porcelain", "--untracked-files=all")
+    assert "entries.jsonl" not in status
+    assert "pitfalls.md" in status or "decisions.md" in status
+
+
+def test_near_duplicate_reinforces_existing_entry(flow, memory):
+    first = flow.json("memory", "add", "--type", "pitfall",
+                      "Always quote globs in bash scripts")
+    second = flow.json("memory", "add", "--type", "pitfall",
+                       "Always quote the globs in bash script")
+    assert second["duplicate"]
+    assert second["id"] == first["id"]
+    assert second["seen"] == 2
+    assert (memory / "pitfalls.md").read_text().count("[pitfall]") == 1
+
+    # Same content under another type is a different entry
+    other = flow.json("memory", "add", "--type", "convention",
+                      "Always quote globs in bash scripts")
+    assert not other["duplicate"]
+    assert other["id"] != first["id"]
+
+
+def test_compact_merges_near_duplicates_in_views(flow, memory):
+    flow.run("memory", "add", "--type", "pitfall", "Always quote globs in bash scripts")
+    # Hand-added near-duplicate: add() would have merged it
+    with (memory / "pitfalls.md").open("a") as f:
+        f.write("\n## 2026-10-16 manual [pitfall]\nAlways quote globs in bash script files\n")
+    flow.run("memory", "add", "--type", "pitfall", "Pin tool versions in CI")
+    view_before = (memory / "pitfalls.md").read_text()
+
+    dry = flow.json("memory", "compact", "--dry-run")
+    assert (dry["before"], dry["after"], dry["merged"]) == (3, 2, 1)
+    assert (memory / "pitfalls.md").read_text() == view_before
+
+    done = flow.json("memory", "compact")
+    assert done["merged"] == 1
+    assert done["views"] == ["pitfalls.md"]
+    view = (memory / "pitfalls.md").read_text()
+    assert view.count("[pitfall]") == 2
+    assert "Pin tool versions in CI" in view
+    assert flow.json("memory", "list")["total"] == 2
+
+
+def test_compact_ages_out_old_entries(flow, memory):
+    with (memory / "decisions.md").open("a") as f:
+        f.write("\n## 2020-01-01 manual [decision]\nShip the legacy installer\n")
+    flow.run("memory", "add", "--type", "decision", "Use SQLite for the state index")
+
+    done = flow.json("memory", "compact", "--max-age-days", "365")
+    assert done["aged_out"] == 1
+    view = (memory / "decisions.md").read_text()
+    assert "legacy installer" not in view
+    assert "SQLite" in view
+
+
+def relevant_task(flow, description, acceptance):
+    flow.run("epic", "create", "--title", "Payments")
+    task = "fn-1-payments.1"
+    flow.run("task", "create", "--epic", "fn-1-payments", "--title", "Harden it")
+    flow.run("task", "set-description", task, "--file", "-", stdin=description)
+    flow.run("task", "set-acceptance", task, "--file", "-", stdin=acceptance)
+    return task
+
+
+def relevant(flow, task):
+    found = flow.json("memory", "relevant", "--task", task)
+    return [(m["entry"].splitlines()[-1], m["score"]) for m in found["matches"]]
+
+
+def test_relevant_ranks_by_description_and_acceptance(flow, memory):
+    flow.run("memory", "add", "--type", "pitfall", "Webhook retries arrive out of order")
+    flow.run("memory", "add", "--type", "convention", "Use idempotency keys for writes")
+    flow.run("memory", "add", "--type", "convention", "Keep CSS grid gaps at 8px")
+    task = relevant_task(
+        flow, "Make webhook handling robust to retries.\n", "- Writes use idempotency keys\n"
+    )
+
+    ranked = [entry for entry, _ in relevant(flow, task)]
+    assert sorted(ranked) == [
+        "Use idempotency keys for writes",
+        "Webhook retries arrive out of order",
+    ]
+
+
+def test_relevant_matches_files_of_evidence_commits(flow, memory, tmp_path):
+    flow.run("memory", "add", "--type", "pitfall", "invoice_export streams rows; never buffer")
+    flow.run("memory", "add", "--type", "pitfall", "Webhook retries arrive out of order")
+    task = relevant_task(flow, "Tidy up.\n", "- Done\n")
+    assert relevant(flow, task) == []
+
+    (flow.repo / "invoice_export.py").write_text("def export():\n    pass\n")
+    git(flow.repo, "add", "invoice_export.py")
+    git(flow.repo, "commit", "-q", "-m", "export")
+    sha = git(flow.repo, "rev-parse", "HEAD").strip()
+    summary = tmp_path / "summary.md"
+    summary.write_text("Done\n")
+    flow.run("start", task)
+    flow.run("done", task, "--summary-file", str(summary),
+             "--evidence", json.dumps({"commits": [sha], "tests": []}))
+
+    found = flow.json("memory", "relevant", "--task", task)
+    assert found["files"] == ["invoice_export.py"]
+    assert [m["entry"].splitlines()[-1] for m in found["matches"]] == [
+        "invoice_export streams rows; never buffer"
+    ]
+
+
+def test_relevant_recomputes_norms_after_add(flow, memory):
+    flow.run("memory", "add", "--type", "pitfall", "Webhook retries arrive out of order")
+    flow.run("memory", "add", "--type", "pitfall", "Webhook secrets rotate monthly")
+    task = relevant_task(flow, "Make webhook retries safe.\n", "- Retries are safe\n")
+    relevant(flow, task)  # Norms cached for two entries
+
+    flow.run("memory", "add", "--type", "decision", "Retries use exponential backoff")
+    flow.run("memory", "add", "--type", "decision", "Retries stop after five attempts")
+    warm = relevant(flow, task)
+
+    # Scores from an index built from scratch, with no cached norms
+    cached = list((flow.repo / ".git" / "flow-state").glob("memory-index/*"))
+    assert cached
+    for path in cached:
+        path.unlink()
+    assert relevant(flow, task) == warm
+    assert len(warm) == 4
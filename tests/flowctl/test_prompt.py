@@ -0,0 +1,27 @@
+"""PromptPacker: task specs are packed whole, one item per spec."""
+
+
+def spec(task_id, body):
+    return f"### {task_id}\n\n{body}"
+
+
+def test_markdown_rules_inside_a_spec_do_not_split_it(flowctl_module):
+    first = spec("fn-1.1", "Intro\n\n---\n\nAfter the rule\n\n---\n\nTail")
+    second = spec("fn-1.2", "Second task " + "words " * 200)
+    budget = flowctl_module.estimate_tokens(first) + 5
+
+    packer = flowctl_module.PromptPacker(budget)
+    *_, specs_text = packer.pack(task_specs=[first, second])
+
+    assert specs_text.startswith(first + "\n\n")
+    assert "Second task" not in specs_text
+    # Only the dropped spec is named, by its heading
+    assert specs_text.endswith("[Omitted to fit the prompt token budget: fn-1.2]")
+
+
+def test_specs_within_budget_are_joined_unchanged(flowctl_module):
+    specs = [spec("fn-1.1", "A\n\n---\n\nB"), spec("fn-1.2", "C")]
+
+    *_, specs_text = flowctl_module.PromptPacker(100000).pack(task_specs=specs)
+
+    assert specs_text == flowctl_module.TASK_SPEC_SEPARATOR.join(specs)
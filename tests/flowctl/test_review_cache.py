@@ -0,0 +1,64 @@
+"""Review cache: keyed by prompt and by the commits under review."""
+
+from conftest import git
+
+PROMPT = "Review this change.\n<diff_content>\n(capped diff)\n</diff_content>"
+
+
+def shipped_run(flowctl, review="Looks good.\n<verdict>SHIP</verdict>"):
+    run = flowctl.CodexRun("thread-1")
+    run.verdict = "SHIP"
+    run._lines.append(review)
+    return run
+
+
+def commit(repo, name, text):
+    (repo / name).write_text(text)
+    git(repo, "add", name)
+    git(repo, "commit", "-q", "-m", f"add {name}")
+
+
+def test_same_prompt_and_commits_hit(flowctl, repo):
+    git(repo, "branch", "base")
+    commit(repo, "a.txt", "a\n")
+    key = flowctl.review_cache_key("impl", PROMPT, "read-only", "base")
+    assert flowctl.review_cache_get(key) is None
+
+    flowctl.review_cache_put(key, shipped_run(flowctl))
+    flowctl.reset_context()
+    again = flowctl.review_cache_key("impl", PROMPT, "read-only", "base")
+    assert again == key
+    cached = flowctl.review_cache_get(again)
+    assert cached.cached and cached.verdict == "SHIP"
+    assert cached.thread_id == "thread-1"
+
+
+def test_new_head_with_identical_prompt_misses(flowctl, repo):
+    git(repo, "branch", "base")
+    commit(repo, "a.txt", "a\n")
+    key = flowctl.review_cache_key("impl", PROMPT, "read-only", "base")
+    flowctl.review_cache_put(key, shipped_run(flowctl))
+
+    # A later commit past the diff cap leaves the rendered prompt unchanged
+    commit(repo, "b.txt", "b\n")
+    flowctl.reset_context()
+    moved = flowctl.review_cache_key("impl", PROMPT, "read-only", "base")
+    assert moved != key
+    assert flowctl.review_cache_get(moved) is None
+
+    # So does a different base with the same HEAD
+    git(repo, "branch", "other", "HEAD~1")
+    assert flowctl.review_cache_key("impl", PROMPT, "read-only", "other") != moved
+
+
+def test_other_review_settings_miss(flowctl, repo):
+    key = flowctl.review_cache_key("impl", PROMPT, "read-only", "HEAD")
+    flowctl.review_cache_put(key, shipped_run(flowctl))
+    assert flowctl.review_cache_key("completion", PROMPT, "read-only", "HEAD") != key
+    assert flowctl.review_cache_key("impl", PROMPT, "workspace-write", "HEAD") != key
+    assert flowctl.review_cache_key("impl", PROMPT + ".", "read-only", "HEAD") != key
+
+
+def test_unresolvable_base_is_not_cached(flowctl, repo):
+    assert flowctl.review_cache_key("impl", PROMPT, "read-only", "no-such-branch") is None
+    assert flowctl.review_cache_get(None) is None
@@ -0,0 +1,137 @@
+"""Runtime state backends and migration between them."""
+
+import fcntl
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from conftest import FLOWCTL
+
+EPIC = "fn-1-add-auth"
+
+
+def make_tasks(flow, count=2):
+    flow.run("epic", "create", "--title", "Add auth")
+    for i in range(1, count + 1):
+        flow.run("task", "create", "--epic", EPIC, "--title", f"Task {i}")
+
+
+def status(flow, task_id):
+    return flow.json("show", task_id)["status"]
+
+
+@pytest.mark.parametrize("middle", ["sqlite", "journal"])
+def test_round_trip_migration_does_not_resurrect_state(flow, middle):
+    make_tasks(flow)
+    flow.run("checkpoint", "save", "--epic", EPIC)  # Before any runtime state
+    flow.run("start", f"{EPIC}.1")
+    flow.run("start", f"{EPIC}.2")
+
+    assert flow.json("migrate-state", "--to", middle)["to"] == middle
+    assert status(flow, f"{EPIC}.1") == "in_progress"
+    flow.run("migrate-state", "--to", "file")
+
+    # Back on the file backend, the runtime state goes away entirely
+    flow.run("checkpoint", "restore", "--epic", EPIC)
+    assert status(flow, f"{EPIC}.1") == "todo"
+
+    migrated = flow.json("migrate-state", "--to", middle)
+    assert migrated["migrated"] == []
+    assert status(flow, f"{EPIC}.1") == "todo"
+    assert status(flow, f"{EPIC}.2") == "todo"
+
+
+def test_migration_carries_every_task(flow):
+    make_tasks(flow, count=3)
+    flow.run("start", f"{EPIC}.1")
+    (flow.repo / "reason.md").write_text("waiting on review\n")
+    flow.run("block", f"{EPIC}.3", "--reason-file", "reason.md")
+
+    out = flow.json("migrate-state", "--to", "sqlite")
+    assert sorted(out["migrated"]) == [f"{EPIC}.1", f"{EPIC}.3"]
+    assert status(flow, f"{EPIC}.1") == "in_progress"
+    assert status(flow, f"{EPIC}.2") == "todo"
+    assert status(flow, f"{EPIC}.3") == "blocked"
+
+    out = flow.json("migrate-state", "--to", "journal")
+    assert sorted(out["migrated"]) == [f"{EPIC}.1", f"{EPIC}.3"]
+    assert status(flow, f"{EPIC}.3") == "blocked"
+    assert flow.run("migrate-state", "--to", "journal", check=False).returncode != 0
+
+
+def test_migration_holds_source_task_locks(flow):
+    make_tasks(flow, count=1)
+    locks_dir = Path(flow.json("state-path")["state_dir"]) / "locks"
+    locks_dir.mkdir(parents=True, exist_ok=True)
+    with open(locks_dir / f"{EPIC}.1.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # A writer mid-update on the file backend
+        proc = subprocess.Popen(
+            [sys.executable, str(FLOWCTL), "migrate-state", "--to", "sqlite"],
+            cwd=flow.repo, env=flow.env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        time.sleep(1.0)
+        assert proc.poll() is None
+        fcntl.flock(lock, fcntl.LOCK_UN)
+    assert proc.wait(timeout=30) == 0
+
+
+@pytest.fixture(params=["file", "journal", "sqlite"])
+def make_store(request, flowctl_module, tmp_path):
+    backend = flowctl_module.STATE_BACKENDS[request.param]
+    return lambda: backend(tmp_path / "state")
+
+
+def test_store_contract(make_store):
+    store = make_store()
+    assert store.load_runtime("fn-1.1") is None
+    assert store.runtime_stamp("fn-1.1") is None
+
+    with store.lock_task("fn-1.1"):
+        store.save_runtime("fn-1.1", {"status": "in_progress", "assignee": "a"})
+    store.save_runtime("fn-1.2", {"status": "done"})
+    assert store.load_runtime("fn-1.1") == {"status": "in_progress", "assignee": "a"}
+    assert sorted(store.list_runtime_files()) == ["fn-1.1", "fn-1.2"]
+    assert store.load_runtime_many(["fn-1.2", "fn-1.3"]) == {
+        "fn-1.2": {"status": "done"}, "fn-1.3": None,
+    }
+    assert [task_id for task_id, _ in store.iter_runtime()] == ["fn-1.1", "fn-1.2"]
+
+    # Another instance (another process) sees the same state
+    other = make_store()
+    assert other.load_runtime("fn-1.2") == {"status": "done"}
+
+    stamp = store.runtime_stamp("fn-1.2")
+    other.save_runtime("fn-1.2", {"status": "todo"})  # Same size as before
+    assert store.runtime_stamp("fn-1.2") != stamp
+    assert store.load_runtime("fn-1.2") == {"status": "todo"}
+
+    store.rename_runtime("fn-1.2", "fn-2.1")
+    assert store.load_runtime("fn-1.2") is None
+    assert store.load_runtime("fn-2.1") == {"status": "todo"}
+
+    store.delete_runtime("fn-2.1")
+    store.delete_runtime("fn-9.9")  # Absent: no-op
+    assert make_store().list_runtime_files() == ["fn-1.1"]
+
+    with store.lock_tasks(["fn-1.2", "fn-1.1", "fn-1.1"]):
+        store.save_runtime("fn-1.1", {"status": "done"})
+    assert other.load_runtime("fn-1.1") == {"status": "done"}
+
+
+def test_journal_compacts_into_snapshot(flowctl_module, tmp_path, monkeypatch):
+    monkeypatch.setenv("FLOW_STATE_JOURNAL_MAX_BYTES", "2000")
+    store = flowctl_module.JournalStateStore(tmp_path / "state")
+    for round_ in range(20):
+        for i in range(5):
+            store.save_runtime(f"fn-1.{i}", {"status": "todo", "round": round_})
+    store.delete_runtime("fn-1.4")
+
+    assert store.journal_path.stat().st_size < 4000
+    assert store.snapshot_path.exists()
+    fresh = flowctl_module.JournalStateStore(tmp_path / "state")
+    assert sorted(fresh.list_runtime_files()) == [f"fn-1.{i}" for i in range(4)]
+    assert fresh.load_runtime("fn-1.3") == {"status": "todo", "round": 19}
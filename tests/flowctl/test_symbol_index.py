@@ -0,0 +1,84 @@
+"""SymbolIndex: blob-keyed symbols and references behind context hints."""
+
+from conftest import git
+
+LIB = "def validate_token():\n    pass\n"
+
+
+def commit_files(repo, files, message="change"):
+    for name, text in files.items():
+        (repo / name).write_text(text)
+    git(repo, "add", *files)
+    git(repo, "commit", "-q", "-m", message)
+
+
+def hints(flowctl):
+    """Context hints from a fresh run (new process state, same index file)."""
+    flowctl.reset_context()
+    return flowctl.gather_context_hints("main").splitlines()[1:]
+
+
+def index_matches_grep(flowctl, symbols, exclude):
+    index = flowctl.get_symbol_index()
+    assert index is not None
+    for max_results in (1, 2, 3):
+        assert index.find_references_many(
+            symbols, exclude, max_results
+        ) == flowctl.find_references_many(symbols, exclude, max_results)
+
+
+def setup_branch(repo):
+    commit_files(repo, {
+        "lib.py": LIB,
+        "app.py": "from lib import validate_token\n\nvalidate_token()\n",
+        "jobs.py": "import lib\n\nlib.close_session()\n",
+    }, "base")
+    git(repo, "checkout", "-q", "-b", "feature")
+    commit_files(repo, {"lib.py": LIB + "\n\ndef refresh_session():\n    pass\n"})
+
+
+def test_hints_follow_commits(flowctl, repo):
+    setup_branch(repo)
+    assert hints(flowctl) == ["- app.py:1 - references validate_token"]
+    index_matches_grep(flowctl, ["validate_token", "close_session"], ["lib.py"])
+
+    # close_session becomes a symbol; only lib.py changed, so jobs.py's
+    # reference comes from what the index stored on the first run
+    commit_files(repo, {"lib.py": LIB + "\n\ndef close_session():\n    pass\n"})
+    assert hints(flowctl) == [
+        "- app.py:1 - references validate_token",
+        "- jobs.py:3 - references close_session",
+    ]
+    index_matches_grep(flowctl, ["validate_token", "close_session"], ["lib.py"])
+
+
+def test_hints_see_unstaged_edits(flowctl, repo):
+    setup_branch(repo)
+    commit_files(repo, {"lib.py": LIB + "\n\ndef close_session():\n    pass\n"})
+    assert "- jobs.py:3 - references close_session" in hints(flowctl)
+
+    (repo / "jobs.py").write_text("import lib\n\n\n\n\nlib.close_session()\n")
+    assert "- jobs.py:6 - references close_session" in hints(flowctl)
+    index_matches_grep(flowctl, ["close_session"], ["lib.py"])
+
+    (repo / "jobs.py").unlink()
+    assert hints(flowctl) == ["- app.py:1 - references validate_token"]
+    index_matches_grep(flowctl, ["close_session"], ["lib.py"])
+
+
+def test_version_bump_drops_cached_entries(flowctl, repo, monkeypatch):
+    setup_branch(repo)
+    index = flowctl.get_symbol_index()
+    assert index.file_symbols("lib.py") == ["validate_token", "refresh_session"]
+    index.find_references_many(["validate_token"], [])
+    # A cached result from an older extractor would be served as is
+    index.conn.execute("UPDATE symbols SET names = '[\"stale\"]'")
+    flowctl.reset_context()
+    assert flowctl.get_symbol_index().file_symbols("lib.py") == ["stale"]
+
+    monkeypatch.setattr(flowctl, "SYMBOL_INDEX_VERSION", flowctl.SYMBOL_INDEX_VERSION + 1)
+    flowctl.reset_context()
+    index = flowctl.get_symbol_index()
+    assert index.conn.execute("SELECT COUNT(*) FROM words").fetchone() == (0,)
+    assert index.file_symbols("lib.py") == ["validate_token", "refresh_session"]
+    assert hints(flowctl) == ["- app.py:1 - references validate_token"]
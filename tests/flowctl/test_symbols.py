@@ -0,0 +1,81 @@
+"""Symbol extraction: the extractor registry, Python ast and mmap reads."""
+
+import mmap
+
+import pytest
+
+PYTHON = '''\
+"""def not_a_symbol(): in a docstring"""
+import asyncio
+
+__all__ = ("exported", 'also_exported', 42)
+
+
+async def fetch(url):
+    def inner():
+        pass
+
+
+class Client:
+    def method(self):
+        pass
+
+
+def exported():
+    pass
+'''
+
+
+def test_python_reads_the_ast(flowctl_module):
+    assert flowctl_module.extract_symbols(PYTHON, ".py") == [
+        "exported", "also_exported", "fetch", "Client",
+    ]
+    # Bytes and str give the same answer
+    assert flowctl_module.extract_symbols(PYTHON.encode(), ".py") == [
+        "exported", "also_exported", "fetch", "Client",
+    ]
+
+
+def test_python_syntax_error_falls_back_to_regexes(flowctl_module):
+    broken = "async def fetch(:\n    pass\n\nclass Client:\n__all__ = ('exported',)\n"
+    assert flowctl_module.extract_symbols(broken, ".py") == ["fetch", "Client", "exported"]
+
+
+def test_registry_picks_extractor_by_suffix(flowctl_module, monkeypatch):
+    registry = dict(flowctl_module.SYMBOL_EXTRACTORS)
+    monkeypatch.setattr(flowctl_module, "SYMBOL_EXTRACTORS", registry)
+    assert flowctl_module.extract_symbols("proc build\n", ".tcl") == []
+
+    flowctl_module.register_symbol_extractor(
+        [".tcl"], flowctl_module.RegexSymbolExtractor((r"^proc\s+(\w+)", None))
+    )
+    assert flowctl_module.extract_symbols("proc a\nproc b\n", ".tcl") == ["a", "b"]
+    assert flowctl_module.extract_symbols("export const x = 1\n", ".ts") == ["x"]
+
+
+@pytest.mark.parametrize("suffix", [".py", ".go"])
+def test_large_files_are_mapped(flowctl_module, tmp_path, monkeypatch, suffix):
+    source = {
+        ".py": "def first():\n    pass\n\nname = 'é'\n",
+        ".go": "func First() {}\n// é\n",
+    }[suffix]
+    tail = {".py": "\ndef last():\n    pass\n", ".go": "\ntype Last struct{}\n"}[suffix]
+    comment = "#" if suffix == ".py" else "//"
+    padding = f"{comment} padding\n" * (flowctl_module.SYMBOL_MMAP_MIN_BYTES // 10)
+    path = tmp_path / f"big{suffix}"
+    path.write_text(source + padding + tail, encoding="utf-8")
+    assert path.stat().st_size >= flowctl_module.SYMBOL_MMAP_MIN_BYTES
+
+    mapped = []
+
+    class SpyMap(mmap.mmap):
+        def __new__(cls, *args, **kwargs):
+            mapped.append(args)
+            return super().__new__(cls, *args, **kwargs)
+
+    monkeypatch.setattr(mmap, "mmap", SpyMap)
+    symbols = flowctl_module.extract_symbols_from_file(path)
+
+    assert mapped
+    assert symbols == flowctl_module.extract_symbols(path.read_text(encoding="utf-8"), suffix)
+    assert len(symbols) == 2
@@ -0,0 +1,38 @@
+"""validate --all: parallel runs report exactly what a serial run does."""
+
+import json
+
+import pytest
+
+
+def make_epics(flow):
+    for n, title in enumerate(["Add auth", "Billing", "Search"], 1):
+        epic = flow.json("epic", "create", "--title", title)["id"]
+        for i in range(1, n + 2):
+            deps = ["--deps", f"{epic}.{i - 1}"] if i > 1 else []
+            flow.run("task", "create", "--epic", epic, "--title", f"Task {i}", *deps)
+    return sorted(p.stem for p in (flow.repo / ".flow" / "epics").glob("fn-*.json"))
+
+
+@pytest.mark.parametrize("extra", [[], ["--graph"]])
+def test_parallel_output_matches_serial(flow, extra):
+    epics = make_epics(flow)
+    tasks = flow.repo / ".flow" / "tasks"
+    # Errors and warnings in more than one epic
+    (tasks / f"{epics[0]}.1.md").unlink()
+    path = tasks / f"{epics[2]}.2.json"
+    task = json.loads(path.read_text())
+    task["depends_on"] = [f"{epics[2]}.9"]
+    path.write_text(json.dumps(task))
+    (flow.repo / ".flow" / "specs" / "fn-9-orphan.md").write_text("# Orphan\n")
+
+    serial = flow.run("validate", "--all", "--json", *extra, check=False)
+    report = json.loads(serial.stdout)
+    assert [e["valid"] for e in report["epics"]] == [False, True, False]
+    assert report["total_warnings"]
+    for jobs in ("3", "0"):
+        parallel = flow.run(
+            "validate", "--all", "--json", "--jobs", jobs, *extra, check=False
+        )
+        assert parallel.returncode == serial.returncode
+        assert parallel.stdout == serial.stdout